@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
+import json
+import zlib
+
 from django.contrib.contenttypes import fields
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from core import metrics
+from core.db import retry_on_lock
 from core.models import MultiRelationModel
-from votes.models import CanVoteMixin, Rating
+from core.throttle import throttle_action
+from votes.models import CanVoteMixin, Rating, VoteBucket
 
 
 class Comment(MultiRelationModel, CanVoteMixin):
@@ -12,8 +19,110 @@ class Comment(MultiRelationModel, CanVoteMixin):
 
 	"""
 	body = models.TextField(u'Текст комментария')
-	add_date = models.DateTimeField(u'Дата добавления')
 	votes = fields.GenericRelation(Rating, related_query_name='comment_vote')
+	vote_buckets = fields.GenericRelation(VoteBucket, related_query_name='comment_bucket')
+
+
+class ArchivedCommentManager(models.Manager):
+	"""Менеджер архива комментариев
+
+	"""
+
+	def archive(self, comment_ids):
+		"""Перенос комментариев вместе с их оценками в архив
+
+		Перенос выполняется в одной транзакции, поэтому прерванную архивацию можно просто запустить повторно
+		:param comment_ids: id переносимых комментариев
+		:return: количество перенесенных комментариев
+		"""
+		with transaction.atomic():
+			comments = list(Comment.objects.filter(pk__in=comment_ids).order_by('pk'))
+			ratings = dict()
+			for object_id, user_id, mark, add_date in Rating.objects.filter(
+				comment_vote__in=comments
+			).order_by('pk').values_list('object_id', 'user_id', 'mark', 'add_date'):
+				ratings.setdefault(object_id, []).append([user_id, mark, add_date.isoformat()])
+			self.bulk_create(
+				ArchivedComment(
+					pk=comment.pk, user_id=comment.user_id, content_type_id=comment.content_type_id,
+					object_id=comment.object_id, add_date=comment.add_date,
+					payload=ArchivedComment.pack(comment.body, ratings.get(comment.pk, []))
+				)
+				for comment in comments
+			)
+			Rating.objects.filter(comment_vote__in=comments).delete()
+			Comment.objects.filter(pk__in=[comment.pk for comment in comments]).delete()
+		return len(comments)
+
+
+class ArchivedComment(MultiRelationModel):
+	"""Модель архивного комментария
+
+	Текст и оценки комментария хранятся в одном сжатом поле. Id совпадает с id исходного комментария
+	"""
+	payload = models.BinaryField(u'Сжатые текст и оценки')
+
+	objects = ArchivedCommentManager()
+
+	@staticmethod
+	def pack(body, ratings):
+		"""Сжатие текста и оценок комментария
+
+		:param body: текст комментария
+		:param ratings: оценки в виде [id пользователя, оценка, дата в формате ISO]
+		:return: сжатые данные
+		"""
+		return zlib.compress(json.dumps({'body': body, 'ratings': ratings}).encode('utf-8'))
+
+	@property
+	def unpacked(self):
+		"""Распакованные текст и оценки комментария
+
+		:return: словарь с ключами body и ratings
+		"""
+		if not hasattr(self, '_unpacked'):
+			self._unpacked = json.loads(zlib.decompress(bytes(self.payload)).decode('utf-8'))
+		return self._unpacked
+
+	@property
+	def body(self):
+		"""Текст комментария
+
+		:return: текст
+		"""
+		return self.unpacked['body']
+
+	@property
+	def ratings(self):
+		"""Оценки комментария на момент архивации
+
+		:return: список (id пользователя, оценка, дата)
+		"""
+		return [(user_id, mark, parse_datetime(add_date)) for user_id, mark, add_date in self.unpacked['ratings']]
+
+	@property
+	def count_of_pluses(self):
+		"""Количество положительных голосов на момент архивации
+
+		:return: положительные голоса
+		"""
+		return sum(1 for _, mark, _ in self.unpacked['ratings'] if mark)
+
+	@property
+	def count_of_minuses(self):
+		"""Количество отрицательных голосов на момент архивации
+
+		:return: отрицательные голоса
+		"""
+		return sum(1 for _, mark, _ in self.unpacked['ratings'] if not mark)
+
+	@property
+	def votes_count(self):
+		"""Общее количество голосов на момент архивации
+
+		:return: количество голосов
+		"""
+		return len(self.unpacked['ratings'])
 
 
 class CanCommentMixin(CanVoteMixin):
@@ -24,12 +133,37 @@ class CanCommentMixin(CanVoteMixin):
 	class Meta:
 		abstract = True
 
+	@throttle_action('comment')
+	@retry_on_lock
 	def comment(self, user, comment_text):
 		"""Добавления комментария к материалу
 
 		:param user: автор комментария
 		:param comment_text: текст комментария
-		:return: True
+		:return: True, либо False, если комментарий отброшен ограничением частоты
 		"""
-		Comment.objects.create(user=user, body=comment_text, add_date=timezone.now(), content_object=self)
+		started = metrics.start()
+		with transaction.atomic():
+			Comment.objects.create(user=user, body=comment_text, add_date=timezone.now(), content_object=self)
+			self.after_comment(user)
+		metrics.COMMENT_DURATION.observe(self._meta.label_lower, started)
 		return True
+
+	def after_comment(self, user):
+		"""Дополнительная запись в транзакции комментария, переопределяется в наследниках
+
+		:param user: автор комментария
+		:return: None
+		"""
+
+	def comment_thread(self):
+		"""Комментарии к материалу, начиная с самых новых, включая архивные
+
+		Архивные комментарии старше действующих, поэтому архив запрашивается только после того, как перебраны все
+		действующие комментарии
+		:return: генератор комментариев
+		"""
+		for comment in self.comments.order_by('-add_date', '-pk').iterator():
+			yield comment
+		for comment in self.archived_comments.order_by('-add_date', '-pk').iterator():
+			yield comment
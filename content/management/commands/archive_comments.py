@@ -0,0 +1,38 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from comments.models import ArchivedComment, Comment
+
+
+class Command(BaseCommand):
+	help = 'Move old comments and their ratings on old news and articles into the comment archive'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--age-days', type=int, default=getattr(settings, 'COMMENTS_ARCHIVE_AGE_DAYS', 365))
+		parser.add_argument(
+			'--content-age-days', type=int, default=getattr(settings, 'COMMENTS_ARCHIVE_CONTENT_AGE_DAYS', 365)
+		)
+		parser.add_argument('--chunk-size', type=int, default=500)
+
+	def handle(self, *args, **options):
+		now = timezone.now()
+		cutoff = now - datetime.timedelta(days=options.get('age_days'))
+		content_cutoff = now - datetime.timedelta(days=options.get('content_age_days'))
+		for relation in ('news_comment', 'article_comment'):
+			candidates = Comment.objects.filter(**{
+				'add_date__lt': cutoff,
+				'%s__date_of_publication__lt' % relation: content_cutoff,
+			})
+			archived = last_pk = 0
+			while True:
+				comment_ids = list(
+					candidates.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options.get('chunk_size')]
+				)
+				if not comment_ids:
+					break
+				archived += ArchivedComment.objects.archive(comment_ids)
+				last_pk = comment_ids[-1]
+			self.stdout.write('%s: %s comments archived' % (relation, archived))
@@ -0,0 +1,31 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core import metrics
+
+
+class Command(BaseCommand):
+	help = 'Measure per-call overhead of vote and comment instrumentation with metrics enabled and disabled'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--calls', type=int, default=200000)
+		parser.add_argument('--repeat', type=int, default=5)
+
+	def handle(self, *args, **options):
+		histogram = metrics.Histogram('benchmark_duration_seconds', 'Benchmark', 'branch', registry=None)
+
+		def instrumented_call():
+			started = metrics.start()
+			histogram.observe('new', started)
+
+		baseline = self.measure(lambda: None, options)
+		for enabled in (True, False):
+			with override_settings(METRICS_ENABLED=enabled):
+				per_call = self.measure(instrumented_call, options) - baseline
+			self.stdout.write('metrics %s: %.0f ns per call' % ('enabled' if enabled else 'disabled', per_call * 1e9))
+
+	def measure(self, func, options):
+		calls = options.get('calls')
+		return min(timeit.repeat(func, number=calls, repeat=options.get('repeat'))) / calls
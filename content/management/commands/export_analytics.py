@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import csv
+import gzip
+import io
+import json
+import os
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+from django.utils.encoding import force_bytes
+
+from comments.models import ArchivedComment, Comment
+from content.models import Article, News
+from votes.models import Rating
+
+CHECKPOINT_NAME = 'checkpoint.json'
+
+# Архивные комментарии сохраняют id исходных комментариев, но архивируются не в порядке id, поэтому id не годится
+# как граница инкрементальной выгрузки: такие таблицы при --incremental выгружаются целиком
+FULL_EXPORT_TABLES = ('archived_comment',)
+
+TABLES = (
+	('rating', Rating, ('id', 'user_id', 'content_type_id', 'object_id', 'mark', 'add_date')),
+	('comment', Comment, ('id', 'user_id', 'content_type_id', 'object_id', 'add_date', 'body')),
+	('archived_comment', ArchivedComment, ('id', 'user_id', 'content_type_id', 'object_id', 'add_date', 'payload')),
+	('news', News, ('id', 'author_id', 'title', 'date_of_creation', 'date_of_publication')),
+	('article', Article, ('id', 'author_id', 'title', 'date_of_creation', 'date_of_publication')),
+)
+
+
+class ExportFile(object):
+	"""Порция файла выгрузки в формате CSV или JSON Lines
+
+	Каждая порция дописывается в файл отдельным завершенным членом gzip, поэтому файл остается читаемым после
+	любой успешно закрытой порции
+	"""
+
+	def __init__(self, path, export_format, columns, header):
+		"""Открытие порции файла выгрузки
+
+		:param path: путь к файлу
+		:param export_format: формат (csv или jsonl)
+		:param columns: названия колонок
+		:param header: записать заголовок CSV
+		"""
+		self.format = export_format
+		self.columns = columns
+		self.file = gzip.open(path, 'ab')
+		if not six.PY2:
+			self.file = io.TextIOWrapper(self.file, encoding='utf-8', newline='')
+		if export_format == 'csv':
+			self.csv = csv.writer(self.file)
+			if header:
+				self.write_csv(columns)
+
+	def write_csv(self, row):
+		"""Запись строки CSV
+
+		:param row: значения колонок
+		:return: None
+		"""
+		row = [json.dumps(value) if isinstance(value, list) else value for value in row]
+		if six.PY2:
+			row = [force_bytes(value) if isinstance(value, six.text_type) else value for value in row]
+		self.csv.writerow(row)
+
+	def write(self, row):
+		"""Запись строки выгрузки
+
+		:param row: значения колонок
+		:return: None
+		"""
+		row = [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+		if self.format == 'csv':
+			self.write_csv(row)
+		else:
+			line = json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + u'\n'
+			self.file.write(force_bytes(line) if six.PY2 else line)
+
+	def close(self):
+		self.file.close()
+
+
+class Command(BaseCommand):
+	help = 'Stream ratings, comments, archived comments, news and articles into compressed CSV or JSON Lines files'
+
+	def add_arguments(self, parser):
+		parser.add_argument('output_dir')
+		parser.add_argument('--format', choices=('csv', 'jsonl'), default='jsonl')
+		parser.add_argument('--chunk-size', type=int, default=5000)
+		parser.add_argument('--resume', action='store_true', help='Continue an interrupted export')
+		parser.add_argument(
+			'--incremental', action='store_true',
+			help='Export only rows added since the last export; archived comments are always exported in full'
+		)
+
+	def handle(self, *args, **options):
+		self.options = options
+		self.output_dir = options.get('output_dir')
+		if not os.path.isdir(self.output_dir):
+			os.makedirs(self.output_dir)
+		continued = options.get('resume') or options.get('incremental')
+		self.checkpoint = self.load_checkpoint() if continued else {}
+		self.content_types = dict(
+			(content_type.pk, content_type.app_label + '.' + content_type.model)
+			for content_type in ContentType.objects.all()
+		)
+		for name, model, columns in TABLES:
+			state = self.checkpoint.get(name)
+			if options.get('resume') and state and state['complete']:
+				continue
+			if options.get('resume') and state:
+				self.checkpoint[name] = dict(state, complete=False)
+			else:
+				if options.get('incremental') and state and name not in FULL_EXPORT_TABLES:
+					last_pk = state['last_pk']
+					file_name = '%s.after-%s.%s.gz' % (name, last_pk, options.get('format'))
+				else:
+					file_name, last_pk = '%s.%s.gz' % (name, options.get('format')), 0
+				self.checkpoint[name] = {'file': file_name, 'last_pk': last_pk, 'size': 0, 'complete': False}
+				open(os.path.join(self.output_dir, file_name), 'wb').close()
+			file_name = self.checkpoint[name]['file']
+			exported = self.export_table(name, model, columns)
+			self.checkpoint[name]['complete'] = True
+			self.save_checkpoint()
+			self.stdout.write('%s: %s rows -> %s' % (name, exported, file_name))
+
+	def export_table(self, name, model, columns):
+		"""Потоковая выгрузка таблицы порциями по первичному ключу
+
+		Память не зависит от размера таблицы. Контрольная точка сохраняется только после того, как порция полностью
+		записана в файл, поэтому прерванную выгрузку можно продолжить
+		:param name: название таблицы в выгрузке
+		:param model: модель таблицы
+		:param columns: выгружаемые поля
+		:return: количество выгруженных строк
+		"""
+		state = self.checkpoint[name]
+		header = list()
+		for column in columns:
+			if column == 'payload':
+				header.extend(['body', 'ratings'])
+			else:
+				header.append('content_type' if column == 'content_type_id' else column)
+		if state.get('size') == 0 and self.options.get('format') == 'csv':
+			self.export_chunk(state, header, [])
+		exported = 0
+		while True:
+			rows = list(model.objects.filter(pk__gt=state['last_pk']).order_by('pk').values_list(
+				*columns
+			)[:self.options.get('chunk_size')])
+			if not rows:
+				return exported
+			self.export_chunk(state, header, rows)
+			exported += len(rows)
+
+	def export_chunk(self, state, header, rows):
+		"""Запись порции строк отдельным членом gzip и сохранение контрольной точки
+
+		Перед записью файл обрезается до размера из контрольной точки, что удаляет недописанную порцию, оставшуюся
+		после аварийного завершения
+		:param state: состояние выгрузки таблицы из контрольной точки
+		:param header: названия колонок выгрузки
+		:param rows: строки порции
+		:return: None
+		"""
+		path = os.path.join(self.output_dir, state['file'])
+		if state.get('size') is not None:
+			with open(path, 'r+b') as raw_file:
+				raw_file.truncate(state['size'])
+		content_type_index = header.index('content_type') if 'content_type' in header else None
+		payload_index = header.index('ratings') - 1 if 'ratings' in header else None
+		export_file = ExportFile(path, self.options.get('format'), header, state.get('size') == 0)
+		for row in rows:
+			row = list(row)
+			if content_type_index is not None:
+				row[content_type_index] = self.content_types.get(row[content_type_index])
+			if payload_index is not None:
+				payload = ArchivedComment(payload=row[payload_index]).unpacked
+				row[payload_index:payload_index + 1] = [payload['body'], payload['ratings']]
+			export_file.write(row)
+		export_file.close()
+		if rows:
+			state['last_pk'] = rows[-1][0]
+		state['size'] = os.path.getsize(path)
+		self.save_checkpoint()
+
+	def load_checkpoint(self):
+		path = os.path.join(self.output_dir, CHECKPOINT_NAME)
+		if not os.path.exists(path):
+			raise CommandError('No checkpoint in %s, run a full export first' % self.output_dir)
+		with open(path) as checkpoint_file:
+			return json.load(checkpoint_file)
+
+	def save_checkpoint(self):
+		path = os.path.join(self.output_dir, CHECKPOINT_NAME)
+		with open(path + '.tmp', 'w') as checkpoint_file:
+			json.dump(self.checkpoint, checkpoint_file)
+		os.rename(path + '.tmp', path)
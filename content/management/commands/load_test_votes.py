@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import collections
+import math
+import multiprocessing
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.db.models import Count, Sum
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from comments.models import Comment
+from content.models import Article, News
+from votes.models import Rating
+
+OPERATIONS = ('vote', 'toggle', 'comment', 'read')
+
+
+def parse_mix(mix):
+	"""Разбор доли операций вида vote=40,toggle=20,comment=20,read=20
+
+	:param mix: строка с долями операций
+	:return: (список операций, список весов)
+	"""
+	weights = dict()
+	for part in mix.split(','):
+		name, _, weight = part.partition('=')
+		if name not in OPERATIONS:
+			raise CommandError('Unknown operation "%s", expected one of: %s' % (name, ', '.join(OPERATIONS)))
+		if not weight.isdigit():
+			raise CommandError('Operation "%s" needs a non-negative integer weight, e.g. %s=10' % (name, name))
+		weights[name] = int(weight)
+	return list(weights), list(weights.values())
+
+
+def percentile(values, rank):
+	"""Перцентиль по методу ближайшего ранга
+
+	:param values: отсортированные значения
+	:param rank: ранг перцентиля (0-100)
+	:return: значение перцентиля
+	"""
+	if not values:
+		return 0.0
+	return values[max(0, int(math.ceil(rank * len(values) / 100.0)) - 1)]
+
+
+def weighted_choice(generator, names, weights):
+	"""Случайный выбор операции с учетом весов
+
+	:param generator: генератор случайных чисел
+	:param names: операции
+	:param weights: веса операций
+	:return: операция
+	"""
+	point = generator.uniform(0, sum(weights))
+	for name, weight in zip(names, weights):
+		point -= weight
+		if point <= 0:
+			return name
+	return names[-1]
+
+
+def run_worker(seed, operations, user_ids, targets, mix, results):
+	"""Выполнение операций одним потоком или процессом нагрузки
+
+	:param seed: зерно генератора случайных чисел
+	:param operations: количество операций
+	:param user_ids: id пользователей
+	:param targets: объекты для голосования и комментирования (метка модели, id)
+	:param mix: (список операций, список весов)
+	:param results: очередь (объект с методом put), в которую записываются результаты
+	:return: None
+	"""
+	generator = random.Random(seed)
+	models = {model._meta.label_lower: model for model in (News, Article, Comment)}
+	latencies = collections.defaultdict(list)
+	errors = collections.Counter()
+	try:
+		users = User.objects.in_bulk(user_ids)
+		objects = [models[label].objects.get(pk=pk) for label, pk in targets]
+		commentable = [obj for obj in objects if hasattr(obj, 'comment')]
+		names, weights = mix
+		for _ in range(operations):
+			name = weighted_choice(generator, names, weights)
+			user = users[generator.choice(user_ids)]
+			started = time.time()
+			try:
+				accepted = True
+				if name == 'vote':
+					accepted = generator.choice(objects).vote(user, generator.random() < 0.5)
+				elif name == 'toggle':
+					obj, mark = generator.choice(objects), generator.random() < 0.5
+					accepted = obj.vote(user, mark) and obj.vote(user, mark)
+				elif name == 'comment':
+					accepted = generator.choice(commentable).comment(user, 'load test comment')
+				else:
+					obj = generator.choice(objects)
+					_ = obj.count_of_pluses, obj.count_of_minuses
+			except OperationalError as error:
+				errors['lock timeout' if 'locked' in str(error) else 'OperationalError'] += 1
+			except DatabaseError as error:
+				errors[type(error).__name__] += 1
+			else:
+				if accepted:
+					latencies[name].append(time.time() - started)
+				else:
+					errors['throttled'] += 1
+	except Exception as error:
+		errors['worker crashed: %s' % error] += 1
+	finally:
+		if not connection.in_atomic_block:
+			connection.close()
+		results.put((dict(latencies), dict(errors)))
+
+
+class Command(BaseCommand):
+	help = 'Drive concurrent votes, toggles, comments and reads and report latency and invariant violations'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--threads', type=int, default=4)
+		parser.add_argument('--processes', type=int, default=0)
+		parser.add_argument('--operations', type=int, default=200, help='Operations per worker')
+		parser.add_argument('--users', type=int, default=20)
+		parser.add_argument('--objects', type=int, default=5, help='News and articles created for the run')
+		parser.add_argument('--mix', default='vote=40,toggle=20,comment=20,read=20')
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument('--no-throttle', action='store_true', help='Disable vote and comment rate limits')
+
+	def handle(self, *args, **options):
+		if options.get('no_throttle'):
+			with override_settings(ACTION_THROTTLE_RATES={}):
+				return self.run(options)
+		return self.run(options)
+
+	def run(self, options):
+		mix = parse_mix(options.get('mix'))
+		user_ids, targets = self.prepare(options.get('users'), options.get('objects'))
+		workers = list()
+		results = multiprocessing.Queue()
+		connections.close_all()
+		for ind in range(options.get('processes')):
+			workers.append(multiprocessing.Process(
+				target=run_worker,
+				args=(options.get('seed') + len(workers), options.get('operations'), user_ids, targets, mix, results)
+			))
+		for ind in range(options.get('threads')):
+			workers.append(threading.Thread(
+				target=run_worker,
+				args=(options.get('seed') + len(workers), options.get('operations'), user_ids, targets, mix, results)
+			))
+		if not workers:
+			raise CommandError('At least one thread or process is required')
+		started = time.time()
+		for worker in workers:
+			worker.start()
+		reports = [results.get() for _ in workers]
+		for worker in workers:
+			worker.join()
+		self.report(reports, time.time() - started)
+		self.check_invariants(targets)
+
+	def prepare(self, users_count, objects_count):
+		"""Создание пользователей и свежих материалов, по которым идет нагрузка
+
+		:param users_count: количество пользователей
+		:param objects_count: количество новостей и статей
+		:return: (id пользователей, объекты в виде (метка модели, id))
+		"""
+		user_ids = list()
+		for ind in range(users_count):
+			username = 'load%s' % ind
+			user = User.objects.filter(username=username).first()
+			if user is None:
+				user = User.objects.create_user(username, '%s@mail.ru' % username, '%spasswd' % username)
+			user_ids.append(user.pk)
+		now = timezone.now()
+		author = User.objects.get(pk=user_ids[0])
+		targets = list()
+		for ind in range(objects_count):
+			for model in (News, Article):
+				obj = model.objects.create(
+					title='load test %s' % ind, body='load test', date_of_creation=now, date_of_publication=now,
+					author=author
+				)
+				comment = Comment.objects.create(user=author, body='load test', add_date=now, content_object=obj)
+				targets.extend([(model._meta.label_lower, obj.pk), (Comment._meta.label_lower, comment.pk)])
+		return user_ids, targets
+
+	def report(self, reports, elapsed):
+		"""Вывод пропускной способности, перцентилей задержки и ошибок
+
+		:param reports: результаты потоков и процессов
+		:param elapsed: длительность нагрузки в секундах
+		:return: None
+		"""
+		latencies = collections.defaultdict(list)
+		errors = collections.Counter()
+		for worker_latencies, worker_errors in reports:
+			for name, values in worker_latencies.items():
+				latencies[name].extend(values)
+			errors.update(worker_errors)
+		total = sum(len(values) for values in latencies.values())
+		self.stdout.write('operations: %s in %.2fs, throughput: %.1f ops/s' % (total, elapsed, total / elapsed))
+		for name in OPERATIONS:
+			values = sorted(latencies.get(name, []))
+			if values:
+				self.stdout.write('%s: count=%s p50=%.2fms p95=%.2fms p99=%.2fms' % (
+					name, len(values), percentile(values, 50) * 1000, percentile(values, 95) * 1000,
+					percentile(values, 99) * 1000
+				))
+		self.stdout.write('lock timeouts: %s' % errors.pop('lock timeout', 0))
+		for name, count in sorted(errors.items()):
+			self.stdout.write('%s: %s' % (name, count))
+
+	def check_invariants(self, targets):
+		"""Проверка отсутствия повторных оценок и расхождений счетчиков голосов
+
+		:param targets: объекты нагрузки в виде (метка модели, id)
+		:return: None
+		"""
+		duplicates = Rating.objects.values('user', 'content_type', 'object_id').annotate(
+			count=Count('id')
+		).filter(count__gt=1).count()
+		negative = mismatched = 0
+		models = {model._meta.label_lower: model for model in (News, Article, Comment)}
+		for label, pk in targets:
+			obj = models[label].objects.get(pk=pk)
+			totals = obj.vote_buckets.aggregate(pluses=Sum('pluses'), minuses=Sum('minuses'))
+			pluses, minuses = totals['pluses'] or 0, totals['minuses'] or 0
+			negative += pluses < 0 or minuses < 0
+			mismatched += (pluses, minuses) != (obj.count_of_pluses, obj.count_of_minuses)
+		self.stdout.write('duplicate ratings: %s' % duplicates)
+		self.stdout.write('negative vote counts: %s' % negative)
+		self.stdout.write('vote counts out of sync: %s' % mismatched)
@@ -0,0 +1,44 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from comments.models import ArchivedComment, Comment
+from content.models import Article, EngagementSketch, News
+from core.hyperloglog import HyperLogLog
+from votes.models import Rating
+
+
+class Command(BaseCommand):
+	help = (
+		'Recompute unique engagement sketches of news and articles from ratings, comments and archived comments; '
+		'users whose votes were cancelled are no longer counted'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--chunk-size', type=int, default=500)
+
+	def handle(self, *args, **options):
+		chunk_size = options.get('chunk_size')
+		for model in (News, Article):
+			content_type = ContentType.objects.get_for_model(model)
+			object_ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+			for offset in range(0, len(object_ids), chunk_size):
+				self.rebuild_chunk(content_type, object_ids[offset:offset + chunk_size])
+			self.stdout.write('%s: %s objects' % (model._meta.label, len(object_ids)))
+
+	def rebuild_chunk(self, content_type, object_ids):
+		counters = dict()
+		for action_model in (Rating, Comment, ArchivedComment):
+			actions = action_model.objects.filter(content_type=content_type, object_id__in=object_ids).values_list(
+				'object_id', 'user_id', 'add_date'
+			)
+			for object_id, user_id, add_date in actions.iterator():
+				key = (object_id, timezone.localtime(add_date).date())
+				counters.setdefault(key, HyperLogLog()).add(user_id)
+		with transaction.atomic():
+			EngagementSketch.objects.filter(content_type=content_type, object_id__in=object_ids).delete()
+			EngagementSketch.objects.bulk_create(
+				EngagementSketch(content_type=content_type, object_id=object_id, day=day, registers=counter.to_bytes())
+				for (object_id, day), counter in counters.items()
+			)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 12:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('content', '0002_auto_20170509_1623'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('day', models.DateField(verbose_name='\u0414\u0435\u043d\u044c')),
+                ('registers', models.BinaryField(verbose_name='\u0420\u0435\u0433\u0438\u0441\u0442\u0440\u044b \u0441\u0447\u0435\u0442\u0447\u0438\u043a\u0430')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='engagementsketch',
+            unique_together=set([('content_type', 'object_id', 'day')]),
+        ),
+    ]
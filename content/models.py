@@ -2,10 +2,88 @@
 from django.contrib.auth.models import User
 from django.contrib.contenttypes import fields
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
 
-from comments.models import Comment, CanCommentMixin
-from votes.models import CanVoteMixin, Rating
+from comments.models import ArchivedComment, Comment, CanCommentMixin
+from core.hyperloglog import HyperLogLog
+from votes.models import CanVoteMixin, Rating, VoteBucket
+
+
+class EngagementSketchQuerySet(models.QuerySet):
+	"""Набор счетчиков уникальных пользователей
+
+	"""
+
+	def merge(self, start=None, end=None):
+		"""Объединение счетчиков за период
+
+		:param start: первый день периода
+		:param end: последний день периода
+		:return: объединенный счетчик
+		"""
+		queryset = self.all()
+		if start is not None:
+			queryset = queryset.filter(day__gte=start)
+		if end is not None:
+			queryset = queryset.filter(day__lte=end)
+		counter = HyperLogLog()
+		for registers in queryset.values_list('registers', flat=True).iterator():
+			counter.update(HyperLogLog(registers))
+		return counter
+
+
+class EngagementSketchManager(models.Manager.from_queryset(EngagementSketchQuerySet)):
+	"""Менеджер счетчиков уникальных пользователей
+
+	"""
+
+	def record(self, obj, user, moment=None):
+		"""Учет пользователя, который проголосовал за материал или прокомментировал его
+
+		Вызывается в транзакции голоса или комментария. Запись в базу производится только если регистры счетчика
+		изменились
+		:param obj: материал
+		:param user: пользователь
+		:param moment: момент действия пользователя
+		:return: None
+		"""
+		day = timezone.localtime(moment or timezone.now()).date()
+		content_type = ContentType.objects.get_for_model(obj)
+		with transaction.atomic():
+			sketch, _ = self.select_for_update().get_or_create(
+				content_type=content_type, object_id=obj.pk, day=day,
+				defaults={'registers': HyperLogLog().to_bytes()}
+			)
+			counter = sketch.counter
+			if counter.add(user.pk):
+				sketch.registers = counter.to_bytes()
+				sketch.save(update_fields=['registers'])
+
+
+class EngagementSketch(models.Model):
+	"""Модель счетчика уникальных пользователей, проголосовавших за материал или прокомментировавших его за день
+
+	"""
+	content_type = models.ForeignKey(ContentType)
+	object_id = models.PositiveIntegerField()
+	content_object = fields.GenericForeignKey('content_type', 'object_id')
+	day = models.DateField(u'День')
+	registers = models.BinaryField(u'Регистры счетчика')
+
+	objects = EngagementSketchManager()
+
+	class Meta:
+		unique_together = ('content_type', 'object_id', 'day')
+
+	@property
+	def counter(self):
+		"""Счетчик HyperLogLog
+
+		:return: счетчик
+		"""
+		return HyperLogLog(self.registers)
 
 
 class ContentObject(CanCommentMixin):
@@ -22,13 +100,45 @@ class ContentObject(CanCommentMixin):
 	date_of_publication = models.DateTimeField(u'Дата публикации')
 	author = models.ForeignKey(User, verbose_name=u'Пользователь')
 
+	def after_vote(self, user, mark):
+		"""Учет проголосовавшего пользователя в счетчике уникальных пользователей
+
+		:param user: проголосовавший пользователь
+		:param mark: оценка пользователя
+		:return: None
+		"""
+		EngagementSketch.objects.record(self, user)
+
+	def after_comment(self, user):
+		"""Учет автора комментария в счетчике уникальных пользователей
+
+		:param user: автор комментария
+		:return: None
+		"""
+		EngagementSketch.objects.record(self, user)
+
+	def unique_engagement(self, start=None, end=None):
+		"""Приблизительное количество уникальных пользователей, проголосовавших за материал или прокомментировавших его
+
+		Пользователь учитывается в момент голоса и остается в счетчике после отмены голоса. Команда
+		rebuild_engagement_sketches пересчитывает счетчики по текущим оценкам и комментариям, поэтому после нее
+		отмененные голоса не учитываются и значение может уменьшиться
+		:param start: первый день периода
+		:param end: последний день периода
+		:return: оценка количества пользователей
+		"""
+		return self.engagement_sketches.merge(start, end).count()
+
 
 class News(ContentObject):
 	"""Модель новости
 
 	"""
 	comments = fields.GenericRelation(Comment, related_query_name='news_comment')
+	archived_comments = fields.GenericRelation(ArchivedComment, related_query_name='news_archived_comment')
 	votes = fields.GenericRelation(Rating, related_query_name='news_vote')
+	vote_buckets = fields.GenericRelation(VoteBucket, related_query_name='news_bucket')
+	engagement_sketches = fields.GenericRelation(EngagementSketch, related_query_name='news_sketch')
 
 
 class Article(ContentObject):
@@ -36,4 +146,19 @@ class Article(ContentObject):
 
 	"""
 	comments = fields.GenericRelation(Comment, related_query_name='article_comment')
+	archived_comments = fields.GenericRelation(ArchivedComment, related_query_name='article_archived_comment')
 	votes = fields.GenericRelation(Rating, related_query_name='article_vote')
+	vote_buckets = fields.GenericRelation(VoteBucket, related_query_name='article_bucket')
+	engagement_sketches = fields.GenericRelation(EngagementSketch, related_query_name='article_sketch')
+
+
+def author_unique_engagement(author, start=None, end=None):
+	"""Приблизительное количество уникальных пользователей, взаимодействовавших с материалами автора
+
+	:param author: автор материалов
+	:param start: первый день периода
+	:param end: последний день периода
+	:return: оценка количества пользователей
+	"""
+	sketches = EngagementSketch.objects.filter(Q(news_sketch__author=author) | Q(article_sketch__author=author))
+	return sketches.merge(start, end).count()
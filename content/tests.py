@@ -1,14 +1,48 @@
 # -*- coding: utf-8 -*-
+import datetime
+import gzip
+import io
+import json
+import os
 import random
 import string
+import threading
 
 import pytest
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import OperationalError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.six import StringIO
 
-from comments.models import Comment
-from content.models import News, Article
-from votes.models import Rating
+from comments.models import ArchivedComment, Comment
+from content.management.commands import export_analytics, load_test_votes
+from content.models import Article, EngagementSketch, News, author_unique_engagement
+from core.db import retry_on_lock
+from core.hyperloglog import HyperLogLog
+from core import metrics
+from core.throttle import allow_action, dropped_actions, get_cache
+from core.models import user_activity
+from votes.models import Rating, VoteBucket, trending
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+	"""Очистка кешей и счетчика отброшенных действий перед каждым тестом, чтобы ограничения частоты действий не
+	переходили между тестами
+
+	:return: None
+	"""
+	cache.clear()
+	get_cache().clear()
+	with metrics.DROPPED_ACTIONS.lock:
+		metrics.DROPPED_ACTIONS.values.clear()
 
 
 @pytest.yield_fixture(scope='module')
@@ -335,3 +369,497 @@ def test_eval_count_votes_of_comment(users_list, comment, vote, expected_count):
 	comment.vote(users_list[1], not vote)
 	comment.vote(users_list[2], vote)
 	assert comment.votes.filter(**filter_params).count() == expected_count
+
+
+@pytest.mark.django_db
+def test_vote_buckets_of_news(user, users_list):
+	"""Тест учета голосов за новость в корзинах статистики (голос, смена оценки, сброс оценки)
+
+	:param user: автор новости
+	:param users_list: список проголосовавших пользователей
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	news = News.objects.create(title='buckets', body='test' * 50, date_of_creation=now, date_of_publication=now,
+	                           author=user)
+	news.vote(users_list[0], True)
+	news.vote(users_list[1], True)
+	news.vote(users_list[1], False)
+	news.vote(users_list[0], True)
+	totals = news.vote_buckets.aggregate(pluses=Sum('pluses'), minuses=Sum('minuses'))
+	assert totals == {'pluses': 0, 'minuses': 1} and news.votes.get(user=users_list[1]).add_date
+
+
+@pytest.mark.django_db
+def test_trending_ranks_by_decayed_velocity(user, users_list):
+	"""Тест ранжирования популярных материалов по скорости набора голосов с затуханием
+
+	:param user: автор материалов
+	:param users_list: список проголосовавших пользователей
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	fresh, stale = [
+		News.objects.create(title='trending', body='test' * 50, date_of_creation=now, date_of_publication=now,
+		                    author=user)
+		for _ in range(2)
+	]
+	VoteBucket.objects.track(stale, True, 3, now - datetime.timedelta(hours=6))
+	fresh.vote(users_list[0], True)
+	fresh.vote(users_list[1], False)
+	ranked = [obj for obj in trending([News], limit=None) if obj in (fresh, stale)]
+	assert ranked == [fresh, stale] and ranked[0].velocity > ranked[1].velocity > 0
+
+
+@pytest.mark.django_db
+def test_compact_vote_buckets(news):
+	"""Тест удаления корзин, вышедших за пределы скользящего окна, не чаще раза за интервал корзины
+
+	:param news: новость, за которую голосовали
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	VoteBucket.objects.track(news, True, 1, now - datetime.timedelta(days=2))
+	first_compaction = VoteBucket.objects.compact_if_due(now + datetime.timedelta(hours=1))
+	second_compaction = VoteBucket.objects.compact_if_due(now + datetime.timedelta(hours=1))
+	assert first_compaction >= 1 and second_compaction is None
+	assert not VoteBucket.objects.filter(news_bucket=news, start__lt=now - datetime.timedelta(days=1)).exists()
+
+
+@pytest.mark.django_db
+def test_engagement_failure_rolls_back_vote(user, users_list, monkeypatch):
+	"""Тест записи счетчика уникальных пользователей в одной транзакции с голосом
+
+	:param user: автор новости
+	:param users_list: список голосующих пользователей
+	:param monkeypatch: подмена записи счетчика на ошибку блокировки
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	news = News.objects.create(title='atomic', body='test' * 50, date_of_creation=now, date_of_publication=now,
+	                           author=user)
+
+	def locked(*args, **kwargs):
+		raise OperationalError('database is locked')
+
+	monkeypatch.setattr(EngagementSketch.objects, 'record', locked)
+	with pytest.raises(OperationalError):
+		news.vote(users_list[0], True)
+	with pytest.raises(OperationalError):
+		news.comment(users_list[0], 'test')
+	assert not news.votes.exists() and not news.comments.exists()
+
+
+def test_hyperloglog_error_bound():
+	"""Тест точности оценки количества уникальных значений и объединения счетчиков
+
+	:return: success test (True/False)
+	"""
+	first, second = HyperLogLog(), HyperLogLog()
+	for value in range(20000):
+		first.add(value)
+	for value in range(10000, 30000):
+		second.add(value)
+	merged = HyperLogLog(first.to_bytes()).update(second)
+	assert abs(merged.count() - 30000) <= 4 * merged.error * 30000
+
+
+@pytest.mark.django_db
+def test_unique_engagement_of_author(users_list):
+	"""Тест подсчета уникальных пользователей, взаимодействовавших с материалами, и пересчета счетчиков
+
+	:param users_list: список пользователей, голосующих и комментирующих материалы
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	author = User.objects.create_user('5' * 8, '%s@mail.ru' % ('5' * 8), '%spasswd' % ('5' * 8))
+	news = News.objects.create(title='engagement', body='test' * 50, date_of_creation=now,
+	                           date_of_publication=now, author=author)
+	article = Article.objects.create(title='engagement', body='test' * 50, date_of_creation=now,
+	                                 date_of_publication=now, author=author)
+	news.vote(users_list[0], True)
+	news.vote(users_list[0], True)
+	news.comment(users_list[0], 'test')
+	news.comment(users_list[1], 'test')
+	article.vote(users_list[2], False)
+	article.vote(users_list[1], True)
+	article.vote(users_list[1], True)
+	counts_before_rebuild = (news.unique_engagement(), article.unique_engagement(), author_unique_engagement(author))
+	EngagementSketch.objects.filter(news_sketch=news).delete()
+	call_command('rebuild_engagement_sketches', stdout=StringIO())
+	assert counts_before_rebuild == (2, 2, 3) and news.unique_engagement() == 2 and article.unique_engagement() == 1
+
+
+@pytest.mark.django_db
+def test_user_activity_pages(news, article, comment):
+	"""Тест постраничной выборки голосов и комментариев пользователя, начиная с самых новых
+
+	:param news: новость
+	:param article: статья
+	:param comment: комментарий
+	:return: success test (True/False)
+	"""
+	visitor = User.objects.create_user('4' * 8, '%s@mail.ru' % ('4' * 8), '%spasswd' % ('4' * 8))
+	news.vote(visitor, True)
+	news.comment(visitor, 'test')
+	article.vote(visitor, False)
+	comment.vote(visitor, True)
+	article.comment(visitor, 'test')
+	expected = sorted(
+		list(Rating.objects.filter(user=visitor)) + list(Comment.objects.filter(user=visitor)),
+		key=lambda item: (item.add_date, item._meta.label_lower, item.pk), reverse=True
+	)
+	pages = [user_activity(visitor, limit=2)]
+	while pages[-1].cursor is not None:
+		pages.append(user_activity(visitor, pages[-1].cursor, limit=2))
+	with CaptureQueriesContext(connection) as queries:
+		targets = [item.content_object for page in pages for item in page.items]
+	items = [item for page in pages for item in page.items]
+	assert items == expected and len(pages) == 3 and comment in targets and not queries.captured_queries
+
+
+@pytest.mark.django_db
+def test_user_activity_deep_page_uses_index_range():
+	"""Тест плана запроса глубокой страницы активности: курсор ограничивает диапазон индекса (user, add_date)
+
+	:return: success test (True/False)
+	"""
+	visitor = User.objects.create_user('5' * 8, '%s@mail.ru' % ('5' * 8), '%spasswd' % ('5' * 8))
+	now = timezone.now()
+	Rating.objects.bulk_create(
+		Rating(user=visitor, content_type=ContentType.objects.get_for_model(News), object_id=ind, mark=True,
+		       add_date=now - datetime.timedelta(seconds=ind // 2))
+		for ind in range(100)
+	)
+	pages = [user_activity(visitor, limit=7, model_classes=[Rating])]
+	while pages[-1].cursor is not None:
+		pages.append(user_activity(visitor, pages[-1].cursor, limit=7, model_classes=[Rating]))
+	sql, params = Rating.activity(visitor, pages[-2].cursor, 8).query.sql_with_params()
+	with connection.cursor() as cursor:
+		cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+		plan = ' '.join(row[-1] for row in cursor.fetchall())
+	expected = Rating.objects.filter(user=visitor).order_by('-add_date', '-pk').values_list('pk', flat=True)
+	assert [item.pk for page in pages for item in page.items] == list(expected) and len(pages) == 15
+	assert 'user_id=? AND add_date<?' in plan
+
+
+def test_load_test_percentile_and_mix():
+	"""Тест перцентилей по методу ближайшего ранга и разбора долей операций нагрузки
+
+	:return: success test (True/False)
+	"""
+	values = list(range(1, 101))
+	percentiles = [load_test_votes.percentile(values, rank) for rank in (50, 95, 99, 100)]
+	assert percentiles == [50, 95, 99, 100] and load_test_votes.percentile([1, 2, 3, 4], 50) == 2
+	assert dict(zip(*load_test_votes.parse_mix('vote=3,read=1'))) == {'vote': 3, 'read': 1}
+	for mix in ('vote', 'vote=x', 'jump=1'):
+		with pytest.raises(CommandError):
+			load_test_votes.parse_mix(mix)
+
+
+@pytest.mark.django_db
+def test_load_test_worker_and_invariants():
+	"""Тест работника нагрузки в текущем потоке и проверки целостности оценок после него
+
+	:return: success test (True/False)
+	"""
+
+	class Results(list):
+		put = list.append
+
+	command = load_test_votes.Command(stdout=StringIO())
+	user_ids, targets = command.prepare(3, 1)
+	results = Results()
+	load_test_votes.run_worker(0, 40, user_ids, targets, load_test_votes.parse_mix('vote=2,toggle=1,comment=1,read=1'),
+	                           results)
+	command.check_invariants(targets)
+	(latencies, errors), = results
+	report = command.stdout.getvalue()
+	assert sum(len(values) for values in latencies.values()) + sum(errors.values()) == 40
+	assert not [error for error in errors if error != 'throttled']
+	assert 'duplicate ratings: 0' in report and 'vote counts out of sync: 0' in report
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_test_votes_keeps_invariants():
+	"""Тест нагрузочной команды: конкурентные голоса и комментарии не нарушают целостность оценок
+
+	:return: success test (True/False)
+	"""
+	if connection.vendor == 'sqlite' and not connection.features.can_share_in_memory_db:
+		pytest.skip(u'Потоки не могут работать с тестовой базой SQLite в памяти')
+	output = StringIO()
+	call_command('load_test_votes', threads=2, operations=30, users=5, objects=2, stdout=output)
+	report = output.getvalue()
+	assert 'worker crashed' not in report and 'duplicate ratings: 0' in report and 'vote counts out of sync: 0' in report
+
+
+@pytest.mark.django_db
+def test_sqlite_pragmas_on_new_connection(settings, tmpdir):
+	"""Тест применения PRAGMA из настроек к новому соединению с файловой базой SQLite
+
+	:param settings: настройки проекта
+	:param tmpdir: временный каталог для файла базы
+	:return: success test (True/False)
+	"""
+	settings.SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 4321}
+	wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=str(tmpdir.join('db.sqlite3'))), 'pragmas')
+	try:
+		cursor = wrapper.cursor()
+		pragmas = [cursor.execute('PRAGMA %s' % name).fetchone()[0] for name in ('journal_mode', 'busy_timeout')]
+	finally:
+		wrapper.close()
+	assert pragmas == ['wal', 4321]
+
+
+def test_retry_on_lock(settings):
+	"""Тест повтора записи, если база заблокирована, и отказа после исчерпания попыток
+
+	:param settings: настройки проекта
+	:return: success test (True/False)
+	"""
+	settings.DATABASE_LOCK_RETRIES = 2
+	calls = list()
+
+	@retry_on_lock
+	def write(failures):
+		calls.append(failures)
+		if len(calls) <= failures:
+			raise OperationalError('database is locked')
+		return True
+
+	succeeded = write(2)
+	del calls[:]
+	with pytest.raises(OperationalError):
+		write(3)
+	assert succeeded and len(calls) == 3
+
+
+@pytest.mark.django_db
+def test_export_analytics_incremental(user, tmpdir):
+	"""Тест потоковой выгрузки оценок с денормализованным типом объекта и последующей инкрементальной выгрузки
+
+	:param user: проголосовавший пользователь
+	:param tmpdir: каталог выгрузки
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	news = News.objects.create(title='export', body='test' * 50, date_of_creation=now, date_of_publication=now,
+	                           author=user)
+	news.vote(user, True)
+	ratings_count = Rating.objects.count()
+	call_command('export_analytics', str(tmpdir), chunk_size=1, stdout=StringIO())
+	call_command('export_analytics', str(tmpdir), format='csv', stdout=StringIO())
+	with gzip.open(str(tmpdir.join('rating.csv.gz'))) as export_file:
+		header = export_file.readline().decode('utf-8').strip()
+	with gzip.open(str(tmpdir.join('rating.jsonl.gz'))) as export_file:
+		full = [json.loads(line.decode('utf-8')) for line in export_file]
+	last_pk = Rating.objects.order_by('pk').last().pk
+	news.vote(user, False)
+	call_command('export_analytics', str(tmpdir), format='csv', incremental=True, stdout=StringIO())
+	with gzip.open(str(tmpdir.join('rating.after-%s.csv.gz' % last_pk))) as export_file:
+		incremental = export_file.read().decode('utf-8').splitlines()
+	assert header == 'id,user_id,content_type,object_id,mark,add_date' and len(incremental) == 2
+	assert full[-1]['content_type'] == 'content.news' and len(full) == ratings_count
+
+
+@pytest.mark.django_db
+def test_vote_flood_is_dropped_before_database(user, users_list, settings):
+	"""Тест отбрасывания лишних голосов пользователя без обращения к базе и подсчета отброшенных голосов
+
+	:param user: автор новости
+	:param users_list: список голосующих пользователей
+	:param settings: настройки проекта
+	:return: success test (True/False)
+	"""
+	settings.ACTION_THROTTLE_RATES = {'vote': {'user': (0.001, 5), 'object': (0.001, 2)}}
+	now = timezone.now()
+	news = News.objects.create(title='flood', body='test' * 50, date_of_creation=now, date_of_publication=now,
+	                           author=user)
+	results = [news.vote(users_list[0], True) for _ in range(4)]
+	with CaptureQueriesContext(connection) as queries:
+		dropped = news.vote(users_list[0], False)
+	results.append(news.vote(users_list[1], True))
+	assert results == [True, True, False, False, True] and dropped is False and not queries.captured_queries
+	assert dropped_actions() == {'vote.user': 0, 'vote.object': 3}
+
+
+@pytest.mark.django_db
+def test_export_analytics_resume_after_crash(user, users_list, tmpdir, monkeypatch):
+	"""Тест продолжения выгрузки после аварийного завершения посреди таблицы с недописанной порцией в файле
+
+	:param user: автор новости
+	:param users_list: список голосующих пользователей
+	:param tmpdir: каталог выгрузки
+	:param monkeypatch: подмена записи порции на аварийное завершение
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	news = News.objects.create(title='resume', body='test' * 50, date_of_creation=now, date_of_publication=now,
+	                           author=user)
+	for voter in users_list:
+		news.vote(voter, True)
+	export_chunk = export_analytics.Command.export_chunk
+	calls = list()
+
+	def crashing_export_chunk(command, state, header, rows):
+		calls.append(rows)
+		if len(calls) == 2:
+			partial = io.BytesIO()
+			gzip_file = gzip.GzipFile(fileobj=partial, mode='wb')
+			gzip_file.write(b'{"id": 0}\n' * 100)
+			gzip_file.flush()
+			with open(os.path.join(command.output_dir, state['file']), 'ab') as raw_file:
+				raw_file.write(partial.getvalue())
+			raise RuntimeError('killed')
+		return export_chunk(command, state, header, rows)
+
+	monkeypatch.setattr(export_analytics.Command, 'export_chunk', crashing_export_chunk)
+	with pytest.raises(RuntimeError):
+		call_command('export_analytics', str(tmpdir), chunk_size=1, stdout=StringIO())
+	monkeypatch.setattr(export_analytics.Command, 'export_chunk', export_chunk)
+	call_command('export_analytics', str(tmpdir), chunk_size=1, resume=True, stdout=StringIO())
+	with gzip.open(str(tmpdir.join('rating.jsonl.gz'))) as export_file:
+		exported = [json.loads(line.decode('utf-8'))['id'] for line in export_file]
+	assert exported == list(Rating.objects.order_by('pk').values_list('pk', flat=True))
+
+
+@pytest.mark.django_db
+def test_archive_old_comments(user, users_list):
+	"""Тест переноса старых комментариев с оценками в архив и чтения ветки комментариев с архивом
+
+	:param user: автор новости и комментариев
+	:param users_list: список пользователей, оценивающих комментарии
+	:return: success test (True/False)
+	"""
+	old = timezone.now() - datetime.timedelta(days=800)
+	news = News.objects.create(title='archive', body='test' * 50, date_of_creation=old, date_of_publication=old,
+	                           author=user)
+	old_comment = Comment.objects.create(user=user, body=u'старый', add_date=old, content_object=news)
+	old_comment.vote(users_list[0], True)
+	old_comment.vote(users_list[1], False)
+	news.comment(user, 'fresh')
+	call_command('archive_comments', chunk_size=1, stdout=StringIO())
+	archived = ArchivedComment.objects.get(pk=old_comment.pk)
+	thread = news.comment_thread()
+	with CaptureQueriesContext(connection) as queries:
+		fresh = next(thread)
+	rest = list(thread)
+	assert fresh.body == 'fresh' and len(queries.captured_queries) == 1 and rest == [archived]
+	assert (rest[0].body, rest[0].count_of_pluses, rest[0].count_of_minuses) == (u'старый', 1, 1)
+	assert not Comment.objects.filter(pk=old_comment.pk).exists() and not old_comment.votes.exists()
+
+
+@pytest.mark.django_db
+def test_archived_comments_in_rebuild_and_export(user, users_list, tmpdir):
+	"""Тест пересчета уникальной вовлеченности и выгрузки после переноса комментариев в архив
+
+	:param user: автор новости
+	:param users_list: список комментирующих пользователей
+	:param tmpdir: каталог выгрузки
+	:return: success test (True/False)
+	"""
+	old = timezone.now() - datetime.timedelta(days=800)
+	news = News.objects.create(title='archive', body='test' * 50, date_of_creation=old, date_of_publication=old,
+	                           author=user)
+	for commentator in users_list[:3]:
+		comment = Comment.objects.create(user=commentator, body=u'старый', add_date=old, content_object=news)
+	comment.vote(user, True)
+	call_command('archive_comments', stdout=StringIO())
+	call_command('rebuild_engagement_sketches', stdout=StringIO())
+	call_command('export_analytics', str(tmpdir), stdout=StringIO())
+	with gzip.open(str(tmpdir.join('archived_comment.jsonl.gz'))) as export_file:
+		exported = [json.loads(line.decode('utf-8')) for line in export_file]
+	assert news.unique_engagement() == 3 and not news.comments.exists()
+	assert [row['body'] for row in exported] == [u'старый'] * 3
+	assert exported[-1]['content_type'] == 'content.news' and [row[:2] for row in exported[-1]['ratings']] == [
+		[user.pk, True]
+	]
+
+
+@pytest.mark.django_db
+def test_archived_comments_incremental_export(user, tmpdir):
+	"""Тест инкрементальной выгрузки архивных комментариев, заархивированных не в порядке id
+
+	:param user: автор новости и комментариев
+	:param tmpdir: каталог выгрузки
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	old = now - datetime.timedelta(days=800)
+	news = News.objects.create(title='archive', body='test' * 50, date_of_creation=old, date_of_publication=old,
+	                           author=user)
+	newer = Comment.objects.create(user=user, body='newer', add_date=now - datetime.timedelta(days=200),
+	                               content_object=news)
+	older = Comment.objects.create(user=user, body='older', add_date=old, content_object=news)
+	call_command('archive_comments', age_days=365, stdout=StringIO())
+	call_command('export_analytics', str(tmpdir), stdout=StringIO())
+	call_command('archive_comments', age_days=100, stdout=StringIO())
+	call_command('export_analytics', str(tmpdir), incremental=True, stdout=StringIO())
+	with gzip.open(str(tmpdir.join('archived_comment.jsonl.gz'))) as export_file:
+		exported = [json.loads(line.decode('utf-8'))['id'] for line in export_file]
+	assert newer.pk < older.pk and exported == [newer.pk, older.pk]
+
+
+def test_concurrent_votes_share_token_bucket(settings):
+	"""Тест одновременных голосов из разных потоков: токенов разрешено потратить не больше емкости корзины
+
+	:param settings: настройки проекта
+	:return: success test (True/False)
+	"""
+	settings.ACTION_THROTTLE_RATES = {'vote': {'user': (0.001, 5), 'object': (0.001, 5)}}
+	voter, news = User(pk=10 ** 6), News(pk=10 ** 6)
+	start, allowed = threading.Event(), list()
+
+	def flood():
+		start.wait()
+		for _ in range(5):
+			allowed.append(allow_action('vote', voter, news))
+
+	threads = [threading.Thread(target=flood) for _ in range(20)]
+	for thread in threads:
+		thread.start()
+	start.set()
+	for thread in threads:
+		thread.join()
+	assert allowed.count(True) == 5 and len(allowed) == 100
+
+
+def test_throttle_survives_cache_eviction():
+	"""Тест ограничения частоты после заполнения обычного кеша и голосов множества других пользователей
+
+	:return: success test (True/False)
+	"""
+	bot, news = User(pk=10 ** 6), News(pk=10 ** 6)
+	results = [allow_action('vote', bot, news, now=1000.0) for _ in range(12)]
+	for ind in range(cache._max_entries + 1):
+		cache.set('filler:%s' % ind, ind)
+	for ind in range(200):
+		allow_action('vote', User(pk=ind + 1), news, now=1000.0)
+	results.append(allow_action('vote', bot, news, now=1000.0))
+	assert results == [True] * 10 + [False] * 3
+	assert get_cache() is not cache and dropped_actions()['vote.object'] == 3
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, user, users_list):
+	"""Тест выдачи метрик веток голосования и комментирования в текстовом формате Prometheus
+
+	:param client: тестовый клиент
+	:param user: автор новости
+	:param users_list: список голосующих пользователей
+	:return: success test (True/False)
+	"""
+	now = timezone.now()
+	news = News.objects.create(title='metrics', body='test' * 50, date_of_creation=now, date_of_publication=now,
+	                           author=user)
+	news.vote(users_list[0], True)
+	news.vote(users_list[0], False)
+	news.vote(users_list[0], False)
+	news.comment(users_list[0], 'test')
+	response = client.get(reverse('metrics'))
+	body = response.content.decode('utf-8')
+	branches = ['kanobu_vote_duration_seconds_count{branch="%s"}' % branch for branch in ('new', 'flip', 'unvote')]
+	assert response.status_code == 200 and response['Content-Type'].startswith('text/plain; version=0.0.4')
+	assert all(branch in body for branch in branches)
+	assert 'kanobu_comment_duration_seconds_bucket{target="content.news",le="+Inf"}' in body
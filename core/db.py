@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+	"""Применение настроек SQLITE_PRAGMAS к новому соединению с базой SQLite
+
+	Обработчик сигнала connection_created. Значения из настроек подставляются как есть, например
+	{'journal_mode': 'WAL', 'busy_timeout': 5000}
+	:param sender: класс обертки соединения
+	:param connection: обертка соединения с базой
+	:return: None
+	"""
+	if connection.vendor != 'sqlite':
+		return
+	for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+		connection.connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def retry_on_lock(func):
+	"""Декоратор повтора записи, если база SQLite заблокирована другой транзакцией
+
+	Повтор производится с экспоненциальной задержкой не более DATABASE_LOCK_RETRIES раз и только вне внешней
+	транзакции, иначе повторяется лишь ее часть
+	:param func: функция, выполняющая запись в собственной транзакции
+	:return: обернутая функция
+	"""
+
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		retries = getattr(settings, 'DATABASE_LOCK_RETRIES', 3)
+		for attempt in range(retries + 1):
+			try:
+				return func(*args, **kwargs)
+			except OperationalError as error:
+				if 'locked' not in str(error) or connection.in_atomic_block or attempt == retries:
+					raise
+				time.sleep(random.uniform(0.5, 1.5) * 0.01 * 2 ** attempt)
+
+	return wrapper
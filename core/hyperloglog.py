@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import math
+import struct
+
+DEFAULT_PRECISION = 10
+
+
+class HyperLogLog(object):
+	"""Вероятностный счетчик количества уникальных значений (HyperLogLog)
+
+	Счетчик хранит 2 ** precision однобайтовых регистров. Относительная стандартная ошибка оценки составляет
+	1.04 / sqrt(2 ** precision): для точности по умолчанию (1024 регистра, 1 Кб) это около 3.25%, то есть примерно
+	в 95% случаев оценка отличается от точного значения не более чем на 6.5%. Счетчики одинаковой точности можно
+	объединять без потери точности. Удалить добавленное значение нельзя
+	"""
+
+	def __init__(self, registers=None, precision=DEFAULT_PRECISION):
+		"""Создание счетчика
+
+		:param registers: сериализованные регистры счетчика
+		:param precision: точность - количество бит хеша, определяющих номер регистра
+		"""
+		self.precision = precision
+		self.size = 1 << precision
+		self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+		if len(self.registers) != self.size:
+			raise ValueError(u'Размер регистров не соответствует точности %s' % precision)
+
+	@property
+	def error(self):
+		"""Относительная стандартная ошибка оценки
+
+		:return: ошибка
+		"""
+		return 1.04 / math.sqrt(self.size)
+
+	def add(self, value):
+		"""Добавление значения в счетчик
+
+		:param value: значение
+		:return: True, если регистры счетчика изменились
+		"""
+		digest = hashlib.sha1(str(value).encode('utf-8')).digest()
+		hashed = struct.unpack('>Q', digest[:8])[0]
+		index = hashed >> (64 - self.precision)
+		bits = 64 - self.precision
+		rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+			return True
+		return False
+
+	def update(self, other):
+		"""Объединение со счетчиком той же точности
+
+		:param other: другой счетчик
+		:return: текущий счетчик
+		"""
+		if other.precision != self.precision:
+			raise ValueError(u'Нельзя объединить счетчики разной точности')
+		self.registers = bytearray(max(pair) for pair in zip(self.registers, other.registers))
+		return self
+
+	def count(self):
+		"""Оценка количества уникальных значений
+
+		Для малых значений используется линейный подсчет по количеству пустых регистров
+		:return: оценка
+		"""
+		alpha = 0.7213 / (1 + 1.079 / self.size)
+		estimate = alpha * self.size ** 2 / sum(2.0 ** -register for register in self.registers)
+		zeros = self.registers.count(b'\x00')
+		if estimate <= 2.5 * self.size and zeros:
+			estimate = self.size * math.log(float(self.size) / zeros)
+		return int(round(estimate))
+
+	def to_bytes(self):
+		"""Сериализация регистров счетчика
+
+		:return: регистры
+		"""
+		return bytes(self.registers)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REGISTRY = []
+
+
+def is_enabled():
+	"""Включен ли сбор метрик (настройка METRICS_ENABLED)
+
+	:return: True, если метрики собираются
+	"""
+	return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def start():
+	"""Начало замера длительности
+
+	:return: момент начала или None, если метрики отключены
+	"""
+	return time.time() if is_enabled() else None
+
+
+class Counter(object):
+	"""Счетчик событий с одной меткой
+
+	Значения хранятся в процессе и общие для всех потоков
+	"""
+
+	def __init__(self, name, documentation, label, registry=REGISTRY):
+		"""Создание и регистрация счетчика
+
+		:param name: название метрики
+		:param documentation: описание метрики
+		:param label: название метки
+		:param registry: список метрик, которые отдаются в render(), None - не регистрировать
+		"""
+		self.name = name
+		self.documentation = documentation
+		self.label = label
+		self.values = dict()
+		self.lock = threading.Lock()
+		if registry is not None:
+			registry.append(self)
+
+	def inc(self, label_value):
+		"""Увеличение счетчика
+
+		:param label_value: значение метки
+		:return: None
+		"""
+		if not is_enabled():
+			return
+		with self.lock:
+			self.values[label_value] = self.values.get(label_value, 0) + 1
+
+	def render(self):
+		"""Строки метрики в текстовом формате Prometheus
+
+		:return: список строк
+		"""
+		lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s counter' % self.name]
+		with self.lock:
+			values = sorted(self.values.items())
+		for label_value, value in values:
+			lines.append('%s{%s="%s"} %s' % (self.name, self.label, label_value, value))
+		return lines
+
+
+class Histogram(object):
+	"""Гистограмма длительности с одной меткой
+
+	Память ограничена: для каждого значения метки хранятся только счетчики фиксированных корзин, сумма и количество
+	"""
+
+	def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+		"""Создание и регистрация гистограммы
+
+		:param name: название метрики
+		:param documentation: описание метрики
+		:param label: название метки
+		:param buckets: верхние границы корзин в секундах
+		:param registry: список метрик, которые отдаются в render(), None - не регистрировать
+		"""
+		self.name = name
+		self.documentation = documentation
+		self.label = label
+		self.buckets = buckets
+		self.values = dict()
+		self.lock = threading.Lock()
+		if registry is not None:
+			registry.append(self)
+
+	def observe(self, label_value, started):
+		"""Учет длительности, прошедшей с начала замера
+
+		:param label_value: значение метки
+		:param started: момент начала, полученный из start()
+		:return: None
+		"""
+		if started is None:
+			return
+		duration = time.time() - started
+		with self.lock:
+			counts, total = self.values.get(label_value) or ([0] * (len(self.buckets) + 1), 0.0)
+			for index, bound in enumerate(self.buckets):
+				if duration <= bound:
+					break
+			else:
+				index = len(self.buckets)
+			counts[index] += 1
+			self.values[label_value] = (counts, total + duration)
+
+	def render(self):
+		"""Строки метрики в текстовом формате Prometheus
+
+		:return: список строк
+		"""
+		lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+		with self.lock:
+			values = sorted((label_value, (list(counts), total)) for label_value, (counts, total) in self.values.items())
+		for label_value, (counts, total) in values:
+			cumulative = 0
+			for bound, count in zip([repr(bound) for bound in self.buckets] + ['+Inf'], counts):
+				cumulative += count
+				lines.append('%s_bucket{%s="%s",le="%s"} %s' % (self.name, self.label, label_value, bound, cumulative))
+			lines.append('%s_sum{%s="%s"} %r' % (self.name, self.label, label_value, total))
+			lines.append('%s_count{%s="%s"} %s' % (self.name, self.label, label_value, cumulative))
+		return lines
+
+
+def render():
+	"""Все метрики процесса в текстовом формате Prometheus
+
+	:return: текст
+	"""
+	return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+VOTE_DURATION = Histogram(
+	'kanobu_vote_duration_seconds', 'Duration of vote() by branch: new vote, flip of the mark or unvote', 'branch'
+)
+COMMENT_DURATION = Histogram('kanobu_comment_duration_seconds', 'Duration of comment()', 'target')
+THROTTLED_ACTIONS = Counter('kanobu_throttled_actions_total', 'Votes and comments dropped by rate limits', 'action')
+DROPPED_ACTIONS = Counter(
+	'kanobu_throttle_dropped_total', 'Votes and comments dropped by rate limits, by empty token bucket', 'bucket'
+)
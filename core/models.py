@@ -1,8 +1,42 @@
 # -*- coding: utf-8 -*-
+import calendar
+import collections
+import datetime
+
+from django.apps import apps
 from django.contrib.auth.models import User
 from django.contrib.contenttypes import fields
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+
+ActivityPage = collections.namedtuple('ActivityPage', ['items', 'cursor'])
+
+
+def encode_activity_cursor(item):
+	"""Курсор страницы активности, указывающий на последнее действие страницы
+
+	:param item: действие пользователя (объект модели MultiRelationModel)
+	:return: курсор
+	"""
+	moment = item.add_date.astimezone(timezone.utc)
+	microseconds = calendar.timegm(moment.utctimetuple()) * 10 ** 6 + moment.microsecond
+	return '%s:%s:%s' % (microseconds, item._meta.label_lower, item.pk)
+
+
+def decode_activity_cursor(cursor):
+	"""Разбор курсора страницы активности
+
+	:param cursor: курсор
+	:return: (время действия, метка модели, id действия)
+	"""
+	try:
+		microseconds, label, pk = cursor.split(':')
+		moment = datetime.datetime.fromtimestamp(0, timezone.utc) + datetime.timedelta(microseconds=int(microseconds))
+		return moment, label, int(pk)
+	except ValueError:
+		raise ValueError(u'Некорректный курсор активности: %s' % cursor)
 
 
 class MultiRelationModel(models.Model):
@@ -13,6 +47,58 @@ class MultiRelationModel(models.Model):
 	content_type = models.ForeignKey(ContentType)
 	object_id = models.PositiveIntegerField()
 	content_object = fields.GenericForeignKey('content_type', 'object_id')
+	add_date = models.DateTimeField(u'Дата добавления')
 
 	class Meta:
 		abstract = True
+		indexes = [models.Index(fields=['user', '-add_date'])]
+
+	@classmethod
+	def activity(cls, user, cursor=None, limit=20):
+		"""Действия пользователя, начиная с самых новых
+
+		Выборка идет по индексу (user, add_date) с курсором вместо смещения, поэтому время получения страницы
+		не зависит от ее номера. Для модели курсора условие OR дополнено границей add_date <= момент курсора, без
+		которой SQLite не может использовать индекс как диапазон и перебирает все более новые действия пользователя
+		:param user: пользователь
+		:param cursor: курсор, полученный вместе с предыдущей страницей
+		:param limit: количество действий на странице
+		:return: queryset действий
+		"""
+		queryset = cls._default_manager.filter(user=user)
+		if cursor is not None:
+			moment, label, pk = decode_activity_cursor(cursor)
+			own_label = cls._meta.label_lower
+			if own_label < label:
+				queryset = queryset.filter(add_date__lte=moment)
+			elif own_label == label:
+				queryset = queryset.filter(add_date__lte=moment).filter(
+					Q(add_date__lt=moment) | Q(add_date=moment, pk__lt=pk)
+				)
+			else:
+				queryset = queryset.filter(add_date__lt=moment)
+		return queryset.order_by('-add_date', '-pk')[:limit]
+
+
+def user_activity(user, cursor=None, limit=20, model_classes=None):
+	"""Страница истории голосов и комментариев пользователя, начиная с самых новых
+
+	Действия разных моделей объединяются по (add_date, метка модели, id), а объекты, к которым они привязаны,
+	загружаются пакетно - одним запросом на каждый тип объекта
+	:param user: пользователь
+	:param cursor: курсор, полученный вместе с предыдущей страницей
+	:param limit: количество действий на странице
+	:param model_classes: модели действий, по умолчанию все модели MultiRelationModel
+	:return: страница активности (действия, курсор следующей страницы или None)
+	"""
+	if model_classes is None:
+		model_classes = [model for model in apps.get_models() if issubclass(model, MultiRelationModel)]
+	items = list()
+	for model in model_classes:
+		items.extend(model.activity(user, cursor, limit + 1))
+	items.sort(key=lambda item: (item.add_date, item._meta.label_lower, item.pk), reverse=True)
+	has_next = len(items) > limit
+	items = items[:limit]
+	for model in model_classes:
+		prefetch_related_objects([item for item in items if isinstance(item, model)], 'content_object')
+	return ActivityPage(items, encode_activity_cursor(items[-1]) if has_next else None)
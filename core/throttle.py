@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import functools
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core import metrics
+
+DEFAULT_RATES = {
+	'vote': {'user': (10.0, 30), 'object': (1.0, 10)},
+	'comment': {'user': (0.5, 10), 'object': (0.5, 5)},
+}
+
+LOCK_WAIT = 0.05
+LOCK_TIMEOUT = 5
+
+
+def get_cache():
+	"""Кеш, в котором хранятся корзины токенов и блокировки
+
+	:return: кеш из настройки ACTION_THROTTLE_CACHE
+	"""
+	return caches[getattr(settings, 'ACTION_THROTTLE_CACHE', 'default')]
+
+
+def get_rates(action):
+	"""Ограничения частоты действия
+
+	Настройка ACTION_THROTTLE_RATES задает для каждого действия пары (токенов в секунду, емкость корзины) для
+	ключей по пользователю ('user') и по пользователю и объекту ('object'). Пустой словарь отключает ограничения
+	:param action: действие (vote или comment)
+	:return: словарь {тип ключа: (скорость, емкость)}
+	"""
+	return getattr(settings, 'ACTION_THROTTLE_RATES', DEFAULT_RATES).get(action, {})
+
+
+def acquire_lock(cache, key):
+	"""Захват блокировки в кеше через атомарный cache.add
+
+	Блокировка работает и между потоками (locmem), и между процессами с общим кешем. Захватившему процессу
+	дается LOCK_TIMEOUT секунд, после чего блокировка снимается сама
+	:param cache: кеш
+	:param key: ключ блокировки
+	:return: True, если блокировка захвачена за LOCK_WAIT секунд
+	"""
+	deadline = time.time() + LOCK_WAIT
+	while not cache.add(key, 1, timeout=LOCK_TIMEOUT):
+		if time.time() >= deadline:
+			return False
+		time.sleep(0.001)
+	return True
+
+
+def count_dropped(action, scope):
+	"""Увеличение счетчика отброшенных действий
+
+	Счетчик хранится в процессе (core.metrics), а не в кеше, поэтому вытеснение ключей его не сбрасывает
+	:param action: действие (vote или comment)
+	:param scope: тип корзины, в которой не хватило токенов
+	:return: None
+	"""
+	metrics.DROPPED_ACTIONS.inc('%s.%s' % (action, scope))
+
+
+def allow_action(action, user, obj, now=None):
+	"""Списание токенов за действие пользователя из корзин по пользователю и по паре пользователь-объект
+
+	Токены списываются только если их хватает во всех корзинах. Отказ учитывается в счетчике той корзины, которая
+	оказалась пустой. Чтение и запись корзин пользователя выполняются под блокировкой пользователя в кеше, поэтому
+	одновременные запросы не могут потратить один и тот же токен; если блокировку не удалось дождаться, действие
+	отбрасывается по корзине пользователя. База данных не используется
+	:param action: действие (vote или comment)
+	:param user: пользователь
+	:param obj: объект действия
+	:param now: текущее время в секундах
+	:return: True, если действие разрешено
+	"""
+	rates = get_rates(action)
+	if not rates:
+		return True
+	cache = get_cache()
+	lock_key = 'throttle:%s:lock:%s' % (action, user.pk)
+	if not acquire_lock(cache, lock_key):
+		count_dropped(action, 'user')
+		return False
+	try:
+		now = time.time() if now is None else now
+		keys = {
+			'user': 'throttle:%s:user:%s' % (action, user.pk),
+			'object': 'throttle:%s:object:%s:%s:%s' % (action, user.pk, obj._meta.label_lower, obj.pk),
+		}
+		states = cache.get_many([keys[scope] for scope in rates])
+		buckets = dict()
+		for scope, (rate, burst) in rates.items():
+			tokens, updated = states.get(keys[scope], (burst, now))
+			buckets[scope] = min(burst, tokens + (now - updated) * rate)
+		empty = [scope for scope, tokens in buckets.items() if tokens < 1]
+		if not empty:
+			buckets = dict((scope, tokens - 1) for scope, tokens in buckets.items())
+		cache.set_many(dict(
+			(keys[scope], (tokens, now)) for scope, tokens in buckets.items()
+		), timeout=int(max(burst / rate for rate, burst in rates.values())) + 1)
+	finally:
+		cache.delete(lock_key)
+	for scope in empty:
+		count_dropped(action, scope)
+	return not empty
+
+
+def dropped_actions():
+	"""Количество отброшенных действий по типам корзин в текущем процессе
+
+	:return: словарь {'действие.тип ключа': количество}
+	"""
+	rates = getattr(settings, 'ACTION_THROTTLE_RATES', DEFAULT_RATES)
+	with metrics.DROPPED_ACTIONS.lock:
+		counters = dict(metrics.DROPPED_ACTIONS.values)
+	return dict(
+		('%s.%s' % (action, scope), counters.get('%s.%s' % (action, scope), 0))
+		for action, scopes in rates.items() for scope in scopes
+	)
+
+
+def throttle_action(action):
+	"""Декоратор ограничения частоты действия пользователя над объектом
+
+	Лишние действия отбрасываются до обращения к базе данных, а метод возвращает False
+	:param action: действие (vote или comment)
+	:return: декоратор метода с аргументами (self, user, ...)
+	"""
+
+	def decorator(method):
+		@functools.wraps(method)
+		def wrapper(self, user, *args, **kwargs):
+			if not allow_action(action, user, self):
+				metrics.THROTTLED_ACTIONS.inc(action)
+				return False
+			return method(self, user, *args, **kwargs)
+
+		return wrapper
+
+	return decorator
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.http import HttpResponse
+
+from core import metrics as metrics_registry
+
+
+def metrics(request):
+	"""Метрики процесса в текстовом формате Prometheus
+
+	:param request: запрос
+	:return: ответ с метриками
+	"""
+	return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -123,3 +123,25 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Caches
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+# Token buckets of core.throttle live in their own cache so that culling of the default cache can't reset rate
+# limits. A bucket key lives at most burst / rate seconds (30 s with DEFAULT_RATES), so MAX_ENTRIES covers the
+# (user, object) pairs active within that time with a margin
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+ACTION_THROTTLE_CACHE = 'throttle'
@@ -0,0 +1,26 @@
+"""
+Production settings for kanobu project on SQLite.
+
+Usage: DJANGO_SETTINGS_MODULE=kanobu.settings_production
+
+WAL journal lets readers work while a vote or comment is being written,
+persistent connections avoid reopening the database file and reapplying
+pragmas on every request.
+"""
+
+from kanobu.settings import *  # noqa
+
+DATABASES['default']['CONN_MAX_AGE'] = 600
+
+# Applied to every new SQLite connection by core.db.apply_sqlite_pragmas
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+# Attempts to repeat vote() and comment() after "database is locked"
+DATABASE_LOCK_RETRIES = 5
@@ -16,6 +16,9 @@ Including another URLconf
 from django.conf.urls import url
 from django.contrib import admin
 
+from core import views as core_views
+
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^metrics$', core_views.metrics, name='metrics'),
 ]
@@ -1,7 +1,57 @@
 # -*- coding: utf-8 -*-
-from django.db import models
+import calendar
+import datetime
+import logging
+import threading
 
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes import fields
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.utils import timezone
+
+from core import metrics
+from core.db import retry_on_lock
 from core.models import MultiRelationModel
+from core.throttle import throttle_action
+
+logger = logging.getLogger(__name__)
+
+
+def get_bucket_size():
+	"""Размер корзины статистики голосов в секундах
+
+	:return: размер корзины
+	"""
+	return getattr(settings, 'VOTES_BUCKET_SIZE', 5 * 60)
+
+
+def get_trending_window():
+	"""Ширина скользящего окна для расчета популярности в секундах
+
+	Корзины старше окна больше не участвуют в расчете и удаляются при уплотнении
+	:return: ширина окна
+	"""
+	return getattr(settings, 'VOTES_TRENDING_WINDOW', 24 * 60 * 60)
+
+
+def get_trending_half_life():
+	"""Период полураспада веса голосов в секундах
+
+	:return: период полураспада
+	"""
+	return getattr(settings, 'VOTES_TRENDING_HALF_LIFE', 2 * 60 * 60)
+
+
+def get_bucket_start(moment):
+	"""Начало корзины, в которую попадает момент времени
+
+	:param moment: момент времени
+	:return: начало корзины
+	"""
+	timestamp = calendar.timegm(moment.utctimetuple())
+	return datetime.datetime.fromtimestamp(timestamp - timestamp % get_bucket_size(), timezone.utc)
 
 
 class CanVoteMixin(models.Model):
@@ -12,23 +62,57 @@ class CanVoteMixin(models.Model):
 	class Meta:
 		abstract = True
 
+	@throttle_action('vote')
+	@retry_on_lock
 	def vote(self, user, mark):
 		"""Добавление голоса к материалу
 
 		Если пользователь повторно ставит оценку, то это считается сбросом оценки пользователя. Если же он ставит
-		противоположную оценку, то предыдущая сбрасывается и устанавливается актуальная
+		противоположную оценку, то предыдущая сбрасывается и устанавливается актуальная. Изменения учитываются в
+		корзине статистики голосов за текущий интервал времени, а длительность - в метрике по ветке (unvote, flip, new).
+		Уплотнение корзин выполняется после завершения транзакции голоса
 		:param user: проголосовавший пользователь
 		:param mark: оценка пользователя
-		:return: True
+		:return: True, либо False, если голос отброшен ограничением частоты
 		"""
-		if self.votes.filter(user=user, mark=mark).exists():
-			self.votes.get(user=user, mark=mark).delete()
-		else:
-			if self.votes.filter(user=user).exists():
-				self.votes.get(user=user).delete()
-			Rating.objects.create(user=user, mark=mark, content_object=self)
+		started = metrics.start()
+		now = timezone.now()
+		with transaction.atomic():
+			if self.votes.filter(user=user, mark=mark).exists():
+				branch = 'unvote'
+				self.votes.get(user=user, mark=mark).delete()
+				VoteBucket.objects.track(self, mark, -1, now)
+			else:
+				branch = 'new'
+				if self.votes.filter(user=user).exists():
+					branch = 'flip'
+					self.votes.get(user=user).delete()
+					VoteBucket.objects.track(self, not mark, -1, now)
+				Rating.objects.create(user=user, mark=mark, add_date=now, content_object=self)
+				VoteBucket.objects.track(self, mark, 1, now)
+			self.after_vote(user, mark)
+		VoteBucket.objects.compact_if_due(now)
+		metrics.VOTE_DURATION.observe(branch, started)
 		return True
 
+	def after_vote(self, user, mark):
+		"""Дополнительная запись в транзакции голоса, переопределяется в наследниках
+
+		:param user: проголосовавший пользователь
+		:param mark: оценка пользователя
+		:return: None
+		"""
+
+	@classmethod
+	def trending(cls, limit=10, moment=None):
+		"""Самые популярные в данный момент объекты модели
+
+		:param limit: количество объектов
+		:param moment: момент времени, на который производится расчет
+		:return: список объектов
+		"""
+		return trending([cls], limit, moment)
+
 	@property
 	def count_of_pluses(self):
 		"""Получение количества положительных голосов
@@ -62,3 +146,138 @@ class Rating(MultiRelationModel):
 
 	"""
 	mark = models.BooleanField(u'Оценка')
+
+
+_compaction_lock = threading.Lock()
+_compaction_state = dict()
+
+
+class VoteBucketManager(models.Manager):
+	"""Менеджер корзин статистики голосов
+
+	"""
+
+	def track(self, obj, mark, delta, moment=None):
+		"""Учет изменения количества голосов объекта в корзине
+
+		:param obj: объект, за который голосовали
+		:param mark: оценка
+		:param delta: изменение количества голосов
+		:param moment: момент голосования
+		:return: None
+		"""
+		moment = moment or timezone.now()
+		field = 'pluses' if mark else 'minuses'
+		lookup = {
+			'content_type': ContentType.objects.get_for_model(obj),
+			'object_id': obj.pk,
+			'start': get_bucket_start(moment),
+		}
+		if self.filter(**lookup).update(**{field: models.F(field) + delta}):
+			return
+		try:
+			with transaction.atomic():
+				self.create(**dict(lookup, **{field: delta}))
+		except IntegrityError:
+			self.filter(**lookup).update(**{field: models.F(field) + delta})
+
+	def compact(self, moment=None):
+		"""Удаление корзин, вышедших за пределы скользящего окна
+
+		:param moment: текущий момент времени
+		:return: количество удаленных корзин
+		"""
+		moment = moment or timezone.now()
+		cutoff = get_bucket_start(moment - datetime.timedelta(seconds=get_trending_window()))
+		deleted, _ = self.filter(start__lt=cutoff).delete()
+		return deleted
+
+	def compact_if_due(self, moment=None):
+		"""Уплотнение корзин не чаще одного раза за интервал корзины в процессе
+
+		Ошибки базы при уплотнении только записываются в лог: голос к этому моменту уже сохранен, и повторять его
+		нельзя. Следующая попытка будет предпринята при следующем голосе
+		:param moment: текущий момент времени
+		:return: количество удаленных корзин или None, если уплотнение не требовалось
+		"""
+		moment = moment or timezone.now()
+		bucket = get_bucket_start(moment)
+		with _compaction_lock:
+			if _compaction_state.get('bucket') is not None and _compaction_state['bucket'] >= bucket:
+				return None
+			_compaction_state['bucket'] = bucket
+		try:
+			return self.compact(moment)
+		except DatabaseError:
+			logger.warning(u'Не удалось уплотнить корзины статистики голосов', exc_info=True)
+			with _compaction_lock:
+				_compaction_state['bucket'] = None
+			return None
+
+	def velocities(self, content_types, moment=None):
+		"""Скорость набора голосов объектами с затуханием по времени
+
+		Вклад каждой корзины уменьшается вдвое за период полураспада
+		:param content_types: типы объектов
+		:param moment: момент времени, на который производится расчет
+		:return: словарь {(id типа объекта, id объекта): скорость}
+		"""
+		moment = moment or timezone.now()
+		half_life = float(get_trending_half_life())
+		cutoff = get_bucket_start(moment - datetime.timedelta(seconds=get_trending_window()))
+		buckets = self.filter(content_type__in=content_types, start__gte=cutoff, start__lte=moment).values_list(
+			'content_type_id', 'object_id', 'start', 'pluses', 'minuses'
+		)
+		velocities = dict()
+		for content_type_id, object_id, start, pluses, minuses in buckets.iterator():
+			weight = 0.5 ** ((moment - start).total_seconds() / half_life)
+			key = (content_type_id, object_id)
+			velocities[key] = velocities.get(key, 0) + (pluses + minuses) * weight
+		return velocities
+
+
+class VoteBucket(models.Model):
+	"""Модель корзины статистики голосов за объект в интервале времени
+
+	"""
+	content_type = models.ForeignKey(ContentType)
+	object_id = models.PositiveIntegerField()
+	content_object = fields.GenericForeignKey('content_type', 'object_id')
+	start = models.DateTimeField(u'Начало интервала', db_index=True)
+	pluses = models.IntegerField(u'Положительные голоса', default=0)
+	minuses = models.IntegerField(u'Отрицательные голоса', default=0)
+
+	objects = VoteBucketManager()
+
+	class Meta:
+		unique_together = ('content_type', 'object_id', 'start')
+
+
+def trending(model_classes=None, limit=10, moment=None):
+	"""Самые популярные в данный момент объекты по скорости набора голосов
+
+	Расчет производится только по таблице корзин. Каждому объекту проставляется атрибут velocity
+	:param model_classes: модели объектов, по умолчанию все модели с голосованием
+	:param limit: количество объектов
+	:param moment: момент времени, на который производится расчет
+	:return: список объектов, упорядоченный по убыванию скорости
+	"""
+	if model_classes is None:
+		model_classes = [model for model in apps.get_models() if issubclass(model, CanVoteMixin)]
+	content_types = ContentType.objects.get_for_models(*model_classes)
+	velocities = VoteBucket.objects.velocities(content_types.values(), moment)
+	ranked = sorted(
+		((key, velocity) for key, velocity in velocities.items() if velocity > 0),
+		key=lambda item: item[1], reverse=True
+	)[:limit]
+	objects = dict()
+	for model, content_type in content_types.items():
+		object_ids = [object_id for (content_type_id, object_id), _ in ranked if content_type_id == content_type.pk]
+		for object_id, obj in model._default_manager.in_bulk(object_ids).items():
+			objects[(content_type.pk, object_id)] = obj
+	result = list()
+	for key, velocity in ranked:
+		if key in objects:
+			objects[key].velocity = velocity
+			result.append(objects[key])
+	return result